@@ -4,18 +4,63 @@ import re
 import sys
 import os
 import argparse
+import hashlib
+import tempfile
+import time
+import functools
 from typing import List, Dict, Any
 
-# USB speed mapping (in Mbps)
-USB_SPEEDS = {
-    '5000': 'USB 3.0',
-    '10000': 'USB 3.1',
-    '480': 'USB 2.0',
-    '12': 'USB 1.1',
-    '1.5': 'USB 1.0',
-}
+def _category(speed_str):
+    # Map a lsusb -t speed (in Mbps) to a USB generation by simple numeric
+    # comparison; cheaper than hashing the handful of known speed strings
+    try:
+        s = float(speed_str)
+    except ValueError:
+        return f"Unknown ({speed_str}M)"
+    if s >= 10000:
+        return 'USB 3.1'
+    if s >= 5000:
+        return 'USB 3.0'
+    if s >= 480:
+        return 'USB 2.0'
+    if s >= 12:
+        return 'USB 1.1'
+    return 'USB 1.0'
+
+# Precompiled pattern for the root bus lines of lsusb -t, compiled once at
+# import; the far more numerous port lines go through _split_tree_port
+_RE_TREE_BUS = re.compile(
+    r'/:\s+Bus (\d+)\.Port (\d+): Dev (\d+), Class=([^,]+), Driver=([^,]+), (\d+(?:\.\d+)?)M',
+    re.ASCII)
 
-# Partial USB vendor lookup (expand as needed)
+def _split_tree_port(line):
+    # Hand-rolled tokenizer for
+    #   "    |__ Port N: Dev M, If K, Class=..., Driver=..., XM"
+    # On lines this short the fixed split/partition walk beats the regex
+    # engine, whose setup cost dominates small inputs.
+    # Returns (port, dev, iface, cls, driver, speed) or None
+    stripped = line.lstrip(' ')
+    if not stripped.startswith('|__ Port '):
+        return None
+    head, sep, rest = stripped[9:].partition(':')
+    if not sep:
+        return None
+    fields = [f.strip() for f in rest.split(', ')]
+    if len(fields) < 5 or not fields[0].startswith('Dev ') or not fields[1].startswith('If '):
+        return None
+    cls = driver = None
+    for part in fields[2:-1]:
+        k, _, v = part.partition('=')
+        if k == 'Class':
+            cls = v
+        elif k == 'Driver':
+            driver = v
+    speed = fields[-1]
+    if cls is None or driver is None or not speed.endswith('M'):
+        return None
+    return head.strip(), fields[0][4:], fields[1][3:], cls, driver, speed[:-1]
+
+# Partial USB vendor lookup, used when no usb.ids database is installed
 USB_VENDORS = {
     '046d': 'Logitech Inc.',
     '04b3': 'IBM Corporation',
@@ -26,196 +71,366 @@ USB_VENDORS = {
     # Add more as needed
 }
 
+# Locations of the full usb.ids vendor database shipped with usbutils/hwdata
+_USB_IDS_PATHS = ('/usr/share/hwdata/usb.ids', '/var/lib/usbutils/usb.ids')
+_RE_VENDOR_LINE = re.compile(r'^([0-9a-f]{4})\s+(.+)$', re.ASCII)
+_VENDOR_CACHE = None
+
+def _vendor_name(vid):
+    # Resolve a vendor ID against usb.ids, parsed lazily on first lookup;
+    # falls back to the small built-in table when the database is missing
+    global _VENDOR_CACHE
+    if _VENDOR_CACHE is None:
+        vendors = dict(USB_VENDORS)
+        for path in _USB_IDS_PATHS:
+            try:
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    for line in f:
+                        # Vendor entries sit at column 0; product sub-lines
+                        # are tab-indented and interface/class tables follow
+                        m = _RE_VENDOR_LINE.match(line)
+                        if m:
+                            vendors[m.group(1)] = m.group(2).strip()
+            except FileNotFoundError:
+                continue
+            break
+        _VENDOR_CACHE = vendors
+    return _VENDOR_CACHE.get(vid, f"Unknown (0x{vid})")
+
+@functools.lru_cache(maxsize=None)
+def _resolve_vendor(vid):
+    # Memoized front-end for _vendor_name; hosts expose few distinct vendor
+    # IDs, so repeated lookups hit the per-ID cache
+    return _vendor_name(vid)
+
 def check_lsusb_installed():
     from shutil import which
     if which('lsusb') is None:
         print("Error: 'lsusb' is not installed. Please install it to use this tool.")
         sys.exit(1)
 
-def get_usb_devices():
+def _spawn_lsusb(args, **popen_kwargs):
+    # Start lsusb without waiting so several invocations can run in parallel
     try:
-        lsusb_output = subprocess.check_output(['lsusb', '-t'], text=True)
+        return subprocess.Popen(['lsusb'] + args, stdout=subprocess.PIPE,
+                                text=True, **popen_kwargs)
     except Exception as e:
         print(f"Error running lsusb: {e}")
-        sys.exit(1)
-    return lsusb_output
+        return None
+
+def get_usb_devices():
+    return _spawn_lsusb(['-t'])
 
 def get_lsusb_details():
-    try:
-        return subprocess.check_output(['lsusb'], text=True)
-    except Exception as e:
-        print(f"Error running lsusb: {e}")
-        sys.exit(1)
+    return _spawn_lsusb([])
+
+# lsusb -v output only changes when devices are plugged/unplugged, so it is
+# cached on disk keyed by a hash of the lsusb -t topology; entries older than
+# the TTL are considered stale
+_VCACHE_DIR = os.path.expanduser('~/.cache/usbview')
+_VCACHE_TTL = 60  # seconds
+
+def _vcache_path(tree):
+    key = hashlib.sha1(tree.encode()).hexdigest()
+    return os.path.join(_VCACHE_DIR, f'{key}.v')
+
+def _iter_open_file(f):
+    # Yield lines from an already-open file, closing it deterministically
+    # once drained (or abandoned) instead of leaving closure to GC
+    with f:
+        yield from f
+
+def _prune_vcache(keep_path):
+    # Drop expired cache entries; once stale they can never hit again
+    now = time.time()
+    for name in os.listdir(_VCACHE_DIR):
+        path = os.path.join(_VCACHE_DIR, name)
+        if not name.endswith('.v') or path == keep_path:
+            continue
+        try:
+            if now - os.path.getmtime(path) >= _VCACHE_TTL:
+                os.unlink(path)
+        except OSError:
+            pass  # Another process may have pruned it already
 
-def get_lsusb_full_details():
+def _iter_proc_lines(proc):
+    # Stream a child's stdout line by line, reaping the process at the end;
+    # a nonzero exit is reported the same way _collect reports it
     try:
-        return subprocess.check_output(['lsusb', '-v'], text=True, stderr=subprocess.DEVNULL)
-    except Exception as e:
-        print(f"Error running lsusb -v: {e}")
-        return ""
+        yield from proc.stdout
+    finally:
+        proc.stdout.close()
+        if proc.wait() != 0:
+            print(f"Error running {' '.join(proc.args)}: exit status {proc.returncode}")
+
+def get_lsusb_full_details(tree=None, use_cache=True):
+    # Returns an iterable of lsusb -v output lines
+    cache_path = None
+    if tree is not None and use_cache:
+        cache_path = _vcache_path(tree)
+        try:
+            if time.time() - os.path.getmtime(cache_path) < _VCACHE_TTL:
+                return _iter_open_file(open(cache_path))
+        except OSError:
+            pass  # No usable cache entry; fall through to lsusb -v
+    if cache_path is None:
+        # Nothing to cache, so the output never needs to be materialized
+        proc = _spawn_lsusb(['-v'], stderr=subprocess.DEVNULL)
+        return _iter_proc_lines(proc) if proc is not None else iter(())
+    output = _collect(_spawn_lsusb(['-v'], stderr=subprocess.DEVNULL),
+                      required=False)
+    if output:
+        try:
+            os.makedirs(_VCACHE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=_VCACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(output)
+            os.replace(tmp_path, cache_path)  # Atomic publish
+            _prune_vcache(cache_path)
+        except OSError:
+            pass  # Caching is best-effort
+    return iter(output.splitlines())
+
+def _collect(proc, required=True):
+    # Wait for a spawned lsusb process; exit (or return '') on failure,
+    # matching the old check_output error handling
+    if proc is not None:
+        output, _ = proc.communicate()
+        if proc.returncode == 0:
+            return output
+        print(f"Error running {' '.join(proc.args)}: exit status {proc.returncode}")
+    if required:
+        sys.exit(1)
+    return ""
 
-def parse_usb_tree(tree_output):
+def parse_usb_tree(tree_lines):
+    # Accepts any iterable of lines (a list or a streaming pipe)
     devices = []
     current_bus = None
-    bus_stack = []
-    for line in tree_output.splitlines():
-        # Detect bus line and update stack
-        bus_match = re.match(r'/.*Bus (\d+)\.Port (\d+): Dev (\d+), Class=([^,]+), Driver=([^,]+), (\d+(?:\.\d+)?)M', line)
-        if bus_match:
-            bus, port, dev, cls, driver, speed = bus_match.groups()
-            current_bus = bus
-            bus_stack = [bus]  # Reset stack for new root
-            category = USB_SPEEDS.get(speed, f"Unknown ({speed}M)")
+    seen = set()  # (bus, dev) pairs already emitted
+    for line in tree_lines:
+        # Cheap literal test first: every bus/port line carries "Class=",
+        # so most lines are skipped without any tokenization
+        if 'Class=' not in line:
+            continue
+        if '|__ Port ' in line:
+            # Sub-device/interface line; it always belongs to the most
+            # recently seen root bus
+            parsed = _split_tree_port(line)
+            if parsed is None:
+                continue
+            port, dev, iface, cls, driver, speed = parsed
+            bus = current_bus or 'Unknown'
+            if (bus, dev) in seen:
+                continue
+            seen.add((bus, dev))
             devices.append({
                 'Bus': bus,
                 'Port': port,
                 'Device': dev,
+                'Interface': iface,
                 'Class': cls,
                 'Driver': driver,
                 'Speed (Mbps)': speed,
-                'Category': category
+                'Category': _category(speed)
             })
-            continue
-        # Detect sub-device/interface lines
-        port_match = re.match(r'(\s*)\|__ Port (\d+): Dev (\d+), If (\d+), Class=([^,]+), Driver=([^,]+), (\d+(?:\.\d+)?)M', line)
-        if port_match:
-            indent, port, dev, iface, cls, driver, speed = port_match.groups()
-            # Infer bus from stack depth (each 4 spaces = one level)
-            depth = len(indent) // 4
-            bus = bus_stack[0] if bus_stack else current_bus if current_bus else 'Unknown'
-            category = USB_SPEEDS.get(speed, f"Unknown ({speed}M)")
+        else:
+            # Root bus line; also tracks the current bus for sub-devices
+            m = _RE_TREE_BUS.match(line)
+            if not m:
+                continue
+            bus, port, dev, cls, driver, speed = m.groups()
+            current_bus = bus
+            if (bus, dev) in seen:
+                continue
+            seen.add((bus, dev))
             devices.append({
                 'Bus': bus,
                 'Port': port,
                 'Device': dev,
-                'Interface': iface,
                 'Class': cls,
                 'Driver': driver,
                 'Speed (Mbps)': speed,
-                'Category': category
+                'Category': _category(speed)
             })
-        # Track current bus for sub-devices (for robustness)
-        bus_only = re.match(r'/.*Bus (\d+)', line)
-        if bus_only:
-            current_bus = bus_only.group(1)
     return devices
 
-def parse_lsusb_details(lsusb_output):
+def _split_lsusb_header(line):
+    # Tokenize "Bus NNN Device NNN: ID vvvv:pppp <description>" with plain
+    # string operations; the format is rigid enough that a regex is overkill.
+    # Returns (bus, dev, vid, pid, description) or None
+    if not line.startswith('Bus '):
+        return None
+    parts = line.split(None, 5)
+    if len(parts) < 6 or parts[2] != 'Device' or parts[4] != 'ID':
+        return None
+    vid, sep, pid_rest = parts[5].partition(':')
+    if not sep or len(vid) != 4 or len(pid_rest) < 4:
+        return None
+    return (parts[1], parts[3].rstrip(':'), vid.lower(), pid_rest[:4],
+            pid_rest[5:].strip())
+
+def parse_lsusb_details(lsusb_lines):
     # Parse lines like: Bus 002 Device 003: ID 046d:c534 Logitech, Inc. Unifying Receiver
     details = {}
-    for line in lsusb_output.splitlines():
-        m = re.match(r'Bus (\d+) Device (\d+): ID ([0-9a-f]{4}):([0-9a-f]{4})', line, re.I)
-        if m:
-            bus, dev, vid, pid = m.groups()
-            vendor = USB_VENDORS.get(vid.lower(), f"Unknown (0x{vid})")
-            details[(bus, dev)] = {'VendorID': vid, 'ProductID': pid, 'VendorName': vendor, 'Raw': line}
+    for line in lsusb_lines:
+        parsed = _split_lsusb_header(line)
+        if parsed:
+            bus, dev, vid, pid, _ = parsed
+            details[(bus, dev)] = {'VendorID': vid, 'ProductID': pid, 'Raw': line.rstrip()}
     return details
 
-def parse_lsusb_full_details(lsusb_v_output):
+# String-descriptor lines of interest in lsusb -v output, keyed by their
+# leading keyword
+_V_FIELDS = {
+    'iManufacturer': 'Manufacturer',
+    'iProduct': 'Product',
+    'iSerial': 'Serial',
+}
+
+def parse_lsusb_full_details(lsusb_v_lines):
     # Parse detailed info for each device
     devices = {}
     current = None
-    for line in lsusb_v_output.splitlines():
-        m = re.match(r'Bus (\d{3}) Device (\d{3}): ID ([0-9a-f]{4}):([0-9a-f]{4}) (.+)', line, re.I)
-        if m:
-            bus, dev, vid, pid, rest = m.groups()
+    for line in lsusb_v_lines:
+        # Device headers are the only lines starting with "Bus "; the
+        # thousands of indented descriptor lines never reach the parser
+        parsed = _split_lsusb_header(line)
+        if parsed and parsed[4]:
+            bus, dev, vid, pid, rest = parsed
             current = (bus, dev)
-            devices[current] = {'VendorID': vid, 'ProductID': pid, 'VendorName': USB_VENDORS.get(vid.lower(), f"Unknown (0x{vid})"), 'ProductName': rest.strip()}
+            devices[current] = {'VendorID': vid, 'ProductID': pid, 'ProductName': rest}
         elif current:
-            # Look for iManufacturer, iProduct, iSerial
-            if 'iManufacturer' in line:
-                devices[current]['Manufacturer'] = line.split(' ', 2)[-1].strip()
-            if 'iProduct' in line:
-                devices[current]['Product'] = line.split(' ', 2)[-1].strip()
-            if 'iSerial' in line:
-                devices[current]['Serial'] = line.split(' ', 2)[-1].strip()
+            # One split plus one dict lookup dispatches the descriptor
+            # fields of interest; unrelated tokens (iProductName etc.)
+            # simply miss the dict
+            tokens = line.split(None, 2)
+            if len(tokens) >= 3:
+                attr = _V_FIELDS.get(tokens[0])
+                if attr is not None:
+                    devices[current][attr] = tokens[2].strip()
     return devices
 
-def print_tree(devices: List[Dict[str, Any]], details: Dict, full_details: Dict, show_extra: bool = True, color: bool = True):
-    try:
-        from colorama import Fore, Style, init
-        init(autoreset=True)
-    except ImportError:
-        color = False
+# Shared default for missing extra-detail entries; avoids building a fresh
+# empty dict per device in the print loop
+_EMPTY = {}
+
+def iter_tree(devices: List[Dict[str, Any]], details: Dict, full_details: Dict, show_extra: bool = True, color: bool = True):
+    # Only pay the colorama import/init when color output is actually wanted
+    if color:
+        try:
+            from colorama import init
+            init(autoreset=True)
+        except ImportError:
+            color = False
     # Build a lookup for (bus, dev) to lsusb line
     lsusb_lines = {}
     for (bus, dev), info in details.items():
         lsusb_lines[(bus, dev)] = info['Raw']
     if not devices:
-        print("No USB devices found.")
+        yield "No USB devices found.\n"
         return
+    # Modern, professional markers: built once, not per device
+    if color:
+        bus_mark_open, bus_mark_close = "\033[1;36m\u25A0 BUS ", " \u25A0\033[0m"
+        root_hub_mark = "\033[1;35m\u25B2 ROOT HUB\033[0m"
+        port_mark = "\033[1;33m\u25B6 PORT\033[0m"
+        device_mark = "\033[1;32m\u25CF DEVICE\033[0m"
+        label_open, label_close = "\033[1;37m", ":\033[0m "
+    else:
+        bus_mark_open, bus_mark_close = "=== BUS ", " ==="
+        root_hub_mark = "[ROOT HUB]"
+        port_mark = "[PORT]"
+        device_mark = "[DEVICE]"
+        label_open, label_close = "", ": "
+    indent_iface = "    "
+    indent_root = "  "
     last_bus = None
-    seen = set()  # Track (bus, dev) pairs already printed
     for d in devices:
         bus = d.get('Bus', '-')
         dev = d.get('Device', '-')
         iface = d.get('Interface', '-')
         key = (bus, dev)
-        if key in seen:
-            continue  # Skip duplicate device
-        seen.add(key)
         lsusb_line = lsusb_lines.get(key)
-        # Modern, professional markers
-        BUS_MARK = f"\033[1;36m\u25A0 BUS {bus} \u25A0\033[0m" if color else f"=== BUS {bus} ==="
-        ROOT_HUB_MARK = f"\033[1;35m\u25B2 ROOT HUB\033[0m" if color else "[ROOT HUB]"
-        PORT_MARK = f"\033[1;33m\u25B6 PORT\033[0m" if color else "[PORT]"
-        DEVICE_MARK = f"\033[1;32m\u25CF DEVICE\033[0m" if color else "[DEVICE]"
         # Print bus header
         if bus != last_bus:
-            print(f"\n{BUS_MARK}")
+            yield (f"\n{bus_mark_open}{bus}{bus_mark_close}\n")
             last_bus = bus
-        indent = "    " if iface != '-' else "  "
+        indent = indent_iface if iface != '-' else indent_root
         # Identify root hub
         is_root_hub = False
         if lsusb_line and 'root hub' in lsusb_line.lower():
             is_root_hub = True
         if lsusb_line:
             if is_root_hub:
-                dev_str = f"{indent}{ROOT_HUB_MARK}  {lsusb_line}"
+                dev_str = f"{indent}{root_hub_mark}  {lsusb_line}"
             else:
-                dev_str = f"{indent}{DEVICE_MARK}  {lsusb_line}"
-            print(dev_str)
+                dev_str = f"{indent}{device_mark}  {lsusb_line}"
+            yield dev_str + '\n'
             # Only print port if not already in lsusb_line
             port = d.get('Port', None)
             if port and port != '-' and f"Port {port}" not in lsusb_line:
-                print(f"{indent}{PORT_MARK}  Port: {port}")
+                yield (f"{indent}{port_mark}  Port: {port}\n")
         else:
             port = d.get('Port', '-')
             cls = d.get('Class', '-')
             driver = d.get('Driver', '-')
             speed = d.get('Speed (Mbps)', '-')
             category = d.get('Category', '-')
-            dev_str = f"{indent}{PORT_MARK}  Port {port} -> {DEVICE_MARK}  Device {dev}"
-            print(dev_str)
-            print(f"{indent}   Class: {cls}, Driver: {driver}, Speed: {speed} Mbps, Category: {category}")
+            dev_str = f"{indent}{port_mark}  Port {port} -> {device_mark}  Device {dev}"
+            yield dev_str + '\n'
+            yield (f"{indent}   Class: {cls}, Driver: {driver}, Speed: {speed} Mbps, Category: {category}\n")
         # Optionally, print extra details from -v
         if show_extra:
-            prod_name = full_details.get(key, {}).get('ProductName', '')
-            manuf = full_details.get(key, {}).get('Manufacturer', '')
-            prod = full_details.get(key, {}).get('Product', '')
-            serial = full_details.get(key, {}).get('Serial', '')
+            extra = full_details.get(key, _EMPTY)
+            prod_name = extra.get('ProductName', '')
+            manuf = extra.get('Manufacturer', '')
+            prod = extra.get('Product', '')
+            serial = extra.get('Serial', '')
             if prod_name:
-                print(f"{indent}   \033[1;37mProduct Name:\033[0m {prod_name}" if color else f"{indent}   Product Name: {prod_name}")
+                yield (f"{indent}   {label_open}Product Name{label_close}{prod_name}\n")
             if manuf:
-                print(f"{indent}   \033[1;37mManufacturer:\033[0m {manuf}" if color else f"{indent}   Manufacturer: {manuf}")
+                yield (f"{indent}   {label_open}Manufacturer{label_close}{manuf}\n")
+            elif 'VendorID' in extra:
+                # No manufacturer string descriptor; fall back to the
+                # usb.ids vendor name, resolved only for rendered devices
+                vendor = _resolve_vendor(extra['VendorID'])
+                yield (f"{indent}   {label_open}Vendor{label_close}{vendor}\n")
             if prod:
-                print(f"{indent}   \033[1;37mProduct:\033[0m {prod}" if color else f"{indent}   Product: {prod}")
+                yield (f"{indent}   {label_open}Product{label_close}{prod}\n")
             if serial:
-                print(f"{indent}   \033[1;37mSerial:\033[0m {serial}" if color else f"{indent}   Serial: {serial}")
+                yield (f"{indent}   {label_open}Serial{label_close}{serial}\n")
 
 def main():
     check_lsusb_installed()
     parser = argparse.ArgumentParser(description='USB Device Tree Viewer')
     parser.add_argument('--no-color', action='store_true', help='Disable color output')
     parser.add_argument('--no-extra', action='store_true', help='Hide extra details from lsusb -v')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the cached lsusb -v output')
     args = parser.parse_args()
-    tree = get_usb_devices()
-    devices = parse_usb_tree(tree)
-    lsusb_out = get_lsusb_details()
-    details = parse_lsusb_details(lsusb_out)
-    lsusb_v_out = get_lsusb_full_details()
-    full_details = parse_lsusb_full_details(lsusb_v_out)
-    print_tree(devices, details, full_details, show_extra=not args.no_extra, color=not args.no_color)
+    # Launch the fast lsusb invocations up front so they run concurrently;
+    # the expensive lsusb -v waits for the tree output, which keys its cache
+    p_tree = get_usb_devices()
+    p_lsusb = get_lsusb_details()
+    # The tree text is kept whole (it keys the -v cache); the other outputs
+    # are parsed straight off the pipes without building intermediate lists
+    tree = _collect(p_tree)
+    if args.no_extra:
+        # The -v output would never be shown; don't pay for collecting it
+        lsusb_v_lines = None
+    else:
+        lsusb_v_lines = get_lsusb_full_details(tree, use_cache=not args.no_cache)
+    devices = parse_usb_tree(tree.splitlines())
+    if p_lsusb is None:
+        sys.exit(1)
+    details = parse_lsusb_details(_iter_proc_lines(p_lsusb))
+    if p_lsusb.returncode != 0:
+        # _iter_proc_lines already reported the failure
+        sys.exit(1)
+    full_details = {} if lsusb_v_lines is None else parse_lsusb_full_details(lsusb_v_lines)
+    # writelines drains the generator, so rendering starts before the
+    # whole device list has been processed
+    sys.stdout.writelines(iter_tree(devices, details, full_details, show_extra=not args.no_extra, color=not args.no_color))
 
 if __name__ == "__main__":
     main()